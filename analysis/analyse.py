@@ -4,43 +4,54 @@ Analyses the data obtained by the crawler following the description of the assig
 """
 from collections import Counter
 from colors import *
-import glob
-from itertools import chain
-import json
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import chain, zip_longest
 import os
 import re
+import sys
 
+import numpy as np
+import orjson
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
-from operator import itemgetter
 from tld import get_fld
 from urllib.parse import urlparse
 
+PREPROCESSED_DATA_FILE = "data/preprocessed_data.pkl"
+# Regular expressions used for the captions and labels of the top ten tables, compiled once
+Y_SUFFIX_REGEX = re.compile(r'y$')
+LABEL_WORDS_REGEX = re.compile(r'(Third-Party|Domain| )')
+# Regular expression for the parts of a cookie expiry date without dashes and spaces, e.g. "Wed,21Oct201507:28:00GMT"
+EXPIRY_DATE_REGEX = re.compile(r'^[A-Za-z]*,?(?P<day>\d{1,2})(?P<month>[A-Za-z]{3})(?P<year>\d{4}|\d{2})'
+                               r'(?P<hour>\d{1,2}):(?P<minute>\d{2}):(?P<second>\d{2})')
+MONTH_NUMBERS = {"jan": "01", "feb": "02", "mar": "03", "apr": "04", "may": "05", "jun": "06",
+                 "jul": "07", "aug": "08", "sep": "09", "oct": "10", "nov": "11", "dec": "12"}
 
+
+@lru_cache(maxsize=1)
 def read_blocklist():
     """Read all domains and their corresponding entities from the blocklist into a set
 
+    The blocklist is only read and parsed once, later calls return the cached dictionary (which should not be modified)
+
     Returns
     -------
     dict
         A dictionary with domains of trackers as key and the corresponding entity name as the value
     """
     with open("data/disconnect_blocklist.json", 'rb') as f:
-        blocklist = json.load(f)
-
-    # Add every domain in the blocklist to a set
-    tracker_domains = dict()
-
-    for cat in blocklist['categories'].keys():
-        for item in blocklist['categories'][cat]:
-            for entityname, urls in item.items():
-                for url, domains in urls.items():
-                    if url == "performance":
-                        continue
-                    for domain in domains:
-                        tracker_domains[domain] = entityname
+        blocklist = orjson.loads(f.read())
+
+    # Map every domain in the blocklist to its entity, skipping the "performance" entries
+    tracker_domains = {domain: entityname
+                       for cat in blocklist['categories'].values()
+                       for item in cat
+                       for entityname, urls in item.items()
+                       for url, domains in urls.items() if url != "performance"
+                       for domain in domains}
     return tracker_domains
 
 
@@ -56,6 +67,8 @@ def domain_in_blocklist(tracker_domains, domain):
 
     Returns
     -------
+    str
+        The (parent) domain that was found in the blocklist, or None if the domain is not present in the blocklist
     bool
         A boolean indicating whether the domain is present in the blocklist or not
     """
@@ -100,38 +113,112 @@ def extract_tracker_domains_entities(third_party_domains, blocklist, blocklist_d
     tracker_entities: set
         A set of all (distinct) tracker entities for a request
     """
-    # Store the domains that are present in the blocklist in order to match them with the entity later
-    domains = list(filter(None, [domain_in_blocklist(blocklist_domains, d)[0] for d in third_party_domains]))
+    tracker_domains = set()
+    tracker_entities = set()
 
-    # Store the sets with (distinct) tracker domains and their corresponding entities
-    tracker_domains = {domain for domain in third_party_domains if domain_in_blocklist(blocklist_domains, domain)[1]}
-    tracker_entities = {blocklist[domain] for domain in domains}
+    # Look up every third-party domain in the blocklist only once and use the matched domain to find the entity
+    for domain in third_party_domains:
+        blocklist_domain, in_blocklist = domain_in_blocklist(blocklist_domains, domain)
+        if in_blocklist:
+            tracker_domains.add(domain)
+            tracker_entities.add(blocklist[blocklist_domain])
 
     return tracker_domains, tracker_entities
 
 
-def calculate_page_load_time(start_time, end_time):
-    """Calculate the page load time by subtracting the the start_time from end_time
+def calculate_page_load_time(start_times, end_times):
+    """Calculate the page load times by subtracting the start_times from end_times
 
     Parameters
     ----------
-    start_time: string
-        A string denoting the start time of the pageload
-    end_time: string
-        A string denoting the end time of the pageload
+    start_times: pandas.core.series.Series
+        A series of strings denoting the start times of the pageloads
+    end_times: pandas.core.series.Series
+        A series of strings denoting the end times of the pageloads
 
     Returns
     -------
-    float
-        The page load time in seconds
+    pandas.core.series.Series
+        The page load times in seconds
     """
-    page_load_start = datetime.strptime(start_time, '%d/%m/%Y %H:%M:%S.%f')
-    page_load_end = datetime.strptime(end_time, '%d/%m/%Y %H:%M:%S.%f')
-    page_load_time = (page_load_end - page_load_start).total_seconds()
+    # Parse the timestamps of all websites at once instead of calling datetime.strptime per website
+    page_load_start = pd.to_datetime(start_times, format='%d/%m/%Y %H:%M:%S.%f')
+    page_load_end = pd.to_datetime(end_times, format='%d/%m/%Y %H:%M:%S.%f')
+    page_load_time = (page_load_end - page_load_start).dt.total_seconds()
 
     return page_load_time
 
 
+def init_worker(blocklist, blocklist_domains):
+    """Store the blocklist in every worker process once, so it does not need to be sent along with every file
+
+    Parameters
+    ----------
+    blocklist: dict
+        A dictionary with domains of trackers as key and the corresponding entity name as the value
+    blocklist_domains: set
+        A set of domains that are in the blocklist
+    """
+    global worker_blocklist, worker_blocklist_domains
+    worker_blocklist = blocklist
+    worker_blocklist_domains = blocklist_domains
+
+
+def read_crawl_file(file):
+    """Read the JSON file of a single crawled website and turn it into a row for the dataframes
+
+    Parameters
+    ----------
+    file: str
+        The path to the JSON file
+
+    Returns
+    -------
+    data_row: list
+        A list with the values for all headers of the data, or None if the crawl of the website failed
+    err_row: list
+        A list with the values for all headers of the errors, or None if the crawl of the website succeeded
+    """
+    # Read the whole file as bytes at once and let orjson parse it, which avoids decoding it to a string first
+    with open(file, 'rb') as f:
+        try:
+            json_file = orjson.loads(f.read())
+            # If an error occured, only 4 items will be stored in the json file
+            if len(json_file) == 4:
+                return None, [json_file['website_domain'],
+                              json_file['tranco_rank'],
+                              json_file['crawl_mode'],
+                              json_file['error']]
+
+            tracker_domains, tracker_entities = extract_tracker_domains_entities(
+                json_file['third_party_domains'], worker_blocklist, worker_blocklist_domains)
+            # Only the URL and the number of cookies of a request are analysed, so the (large) headers are dropped.
+            # This keeps the rows small when they are sent back from the worker processes and kept in the dataframe.
+            requests = [{"request_url": request['request_url'], "nr_cookies": request['nr_cookies']}
+                        for request in json_file['requests']]
+            return [json_file['website_domain'],
+                    json_file['tranco_rank'],
+                    json_file['crawl_mode'],
+                    json_file['pageload_start_ts'],
+                    json_file['pageload_end_ts'],
+                    None,  # The page load times are calculated for all websites at once in write_data_to_dataframe
+                    json_file['post_pageload_url'],
+                    json_file['consent_status'],
+                    json_file['cookies'],
+                    json_file['third_party_domains'],
+                    len(json_file['third_party_domains']),
+                    requests,
+                    len(requests),
+                    list(tracker_domains),
+                    len(tracker_domains),
+                    list(tracker_entities),
+                    len(tracker_entities),
+                    json_file['redirect_pairs']], None
+        except KeyError:
+            print(f"Skipping {file} because of bad formatting.")
+            return None, None
+
+
 def write_data_to_dataframe(headers, blocklist, blocklist_domains):
     """Writes the data from the JSON files for all the crawled websites to a CSV file
 
@@ -154,52 +241,62 @@ def write_data_to_dataframe(headers, blocklist, blocklist_domains):
     data = []
     errors = []
 
-    # Get all JSON files within the crawl_data folder
-    files = glob.glob("../crawl_data/*.json")
-    for file in files:
-        with open(file, 'r') as f:
-            try:
-                json_file = json.load(f)
-                # If an error occured, only 4 items will be stored in the json file
-                if len(json_file) == 4:
-                    errors.append([json_file['website_domain'],
-                                   json_file['tranco_rank'],
-                                   json_file['crawl_mode'],
-                                   json_file['error']])
-                else:
-                    tracker_domains, tracker_entities = extract_tracker_domains_entities(
-                        json_file['third_party_domains'], blocklist, blocklist_domains)
-                    page_load_time = calculate_page_load_time(json_file['pageload_start_ts'], json_file['pageload_end_ts'])
-                    data.append([json_file['website_domain'],
-                                 json_file['tranco_rank'],
-                                 json_file['crawl_mode'],
-                                 json_file['pageload_start_ts'],
-                                 json_file['pageload_end_ts'],
-                                 page_load_time,
-                                 json_file['post_pageload_url'],
-                                 json_file['consent_status'],
-                                 json_file['cookies'],
-                                 json_file['third_party_domains'],
-                                 len(json_file['third_party_domains']),
-                                 json_file['requests'],
-                                 len(json_file['requests']),
-                                 list(tracker_domains),
-                                 len(tracker_domains),
-                                 list(tracker_entities),
-                                 len(tracker_entities),
-                                 json_file['redirect_pairs']])
-            except KeyError:
-                print(f"Skipping {file} because of bad formatting.")
+    # Get all JSON files within the crawl_data folder, the largest files first so that no worker process is still
+    # busy with a large file when all other files are done
+    with os.scandir("../crawl_data") as entries:
+        json_entries = [entry for entry in entries if entry.name.endswith(".json") and entry.is_file()]
+    files = [entry.path for entry in sorted(json_entries, key=lambda entry: entry.stat().st_size, reverse=True)]
+
+    # The JSON files are independent of each other, so they are read and parsed by a pool of worker processes.
+    # Files are handed out in chunks to limit the communication overhead between the processes.
+    # The same domains and entities occur for many websites, so they are interned to let all rows share one string
+    domain_columns = [headers.index(header) for header in ["third_party_domains", "tracker_domains", "tracker_entities"]]
+
+    with ProcessPoolExecutor(initializer=init_worker, initargs=(blocklist, blocklist_domains)) as executor:
+        for data_row, err_row in executor.map(read_crawl_file, files, chunksize=32):
+            if data_row:
+                for column in domain_columns:
+                    data_row[column] = [sys.intern(domain) for domain in data_row[column]]
+                data.append(data_row)
+            elif err_row:
+                errors.append(err_row)
 
     # Write the data to a Pandas dataframe
     dataframe = pd.DataFrame(data, columns=headers)
+    dataframe["page_load_time"] = calculate_page_load_time(dataframe["pageload_start_ts"], dataframe["pageload_end_ts"])
     err_dataframe = pd.DataFrame(errors, columns=["website_domain", "tranco_rank", "crawl_mode", "error"])
 
+    # There are only two crawl modes, so comparisons on the column are much cheaper when it is stored as a category
+    dataframe["crawl_mode"] = dataframe["crawl_mode"].astype("category")
+    err_dataframe["crawl_mode"] = err_dataframe["crawl_mode"].astype("category")
+
     return dataframe, err_dataframe
 
 
+def preprocessed_data_is_up_to_date():
+    """Check whether the preprocessed data that was stored by an earlier run can be reused
+
+    Returns
+    -------
+    bool
+        A boolean indicating whether the stored dataframes exist and are newer than the crawl data, the blocklist
+        and this script
+    """
+    if not os.path.isfile(PREPROCESSED_DATA_FILE):
+        return False
+
+    # The modification time of the folder itself changes when JSON files are added or removed
+    with os.scandir("../crawl_data") as entries:
+        modification_times = [entry.stat().st_mtime for entry in entries if entry.name.endswith(".json")]
+    modification_times += [os.path.getmtime("../crawl_data"), os.path.getmtime("data/disconnect_blocklist.json"),
+                           os.path.getmtime(__file__)]
+
+    return os.path.getmtime(PREPROCESSED_DATA_FILE) > max(modification_times)
+
+
 def preprocess_data():
-    """This function turns the data into a csv file and in turn this csv file to a Pandas dataframe
+    """This function turns the data into a Pandas dataframe, or loads the dataframes stored by an earlier run when
+    the data has not changed since then
 
     Returns
     -------
@@ -215,7 +312,12 @@ def preprocess_data():
     blocklist = read_blocklist()
     blocklist_domains = set(blocklist.keys())
 
-    dataframe, err_dataframe = write_data_to_dataframe(headers, blocklist, blocklist_domains)
+    # Reuse the dataframes of an earlier run if nothing has changed since, otherwise build them and store them
+    if preprocessed_data_is_up_to_date():
+        dataframe, err_dataframe = pd.read_pickle(PREPROCESSED_DATA_FILE)
+    else:
+        dataframe, err_dataframe = write_data_to_dataframe(headers, blocklist, blocklist_domains)
+        pd.to_pickle((dataframe, err_dataframe), PREPROCESSED_DATA_FILE)
 
     return dataframe, err_dataframe, blocklist_domains
 
@@ -257,30 +359,27 @@ def generate_table_question_1(dataframe, err_dataframe):
     headers = [("error", "Timeout", "Page load timeout", err_dataframe), ("error", "TLS", "TLS error", err_dataframe),
                ("consent_status", "errored", "Consent click error", dataframe)]
 
-    # Remove the file if it is already existing
-    if os.path.isfile("data/table_question_1.tex"):
-        os.remove("data/table_question_1.tex")
-
-    # Open the file and write to it
-    file = open("data/table_question_1.tex", "a")
-    file.write("\\begin{table}[ht] \n")
-    file.write("\caption{Number of failures encountered during each crawl.} \n")
-    file.write("\centering \n")
-    file.write("\\begin{tabular}{|l|r|r|} \n")
-    file.write("\hline \n")
-    file.write(
+    # Build the table line by line, so it can be written to the file at once
+    lines = []
+    lines.append("\\begin{table}[ht] \n")
+    lines.append("\caption{Number of failures encountered during each crawl.} \n")
+    lines.append("\centering \n")
+    lines.append("\\begin{tabular}{|l|r|r|} \n")
+    lines.append("\hline \n")
+    lines.append(
         "\\textbf{Error type} & \multicolumn{1}{l|}{\\textbf{Crawl-desktop}} & \multicolumn{1}{l|}{\\textbf{Crawl-mobile}} \\\\ \hline \n")
 
     for header in headers:
         entry = generate_entry_table_question_1(header)
-        file.write(entry)
+        lines.append(entry)
 
-    file.write("\end{tabular} \n")
-    file.write("\label{table:NumberOfFailures} \n")
-    file.write("\end{table}")
+    lines.append("\end{tabular} \n")
+    lines.append("\label{table:NumberOfFailures} \n")
+    lines.append("\end{table}")
 
-    # Close the file
-    file.close()
+    # Write the whole table to the file in a single call, "w" mode overwrites an existing file
+    with open("data/table_question_1.tex", 'w') as file:
+        file.write("".join(lines))
 
 
 def customize_grid(ax, border, yaxis, xaxis, bg_color='white', grid_color='gray', width=1.2, yminor=True, xminor=True):
@@ -322,7 +421,7 @@ def customize_grid(ax, border, yaxis, xaxis, bg_color='white', grid_color='gray'
 
 
 def customize_box_plot_color(ax):
-    """Customize the colors of all boxplot parts
+    """Customize the colors of the boxes, the other boxplot parts are styled by the boxplot call itself
 
     Parameters
     ----------
@@ -331,14 +430,6 @@ def customize_box_plot_color(ax):
     """
     for i, box in enumerate(ax['boxes']):
         box.set(facecolor=BOX_FACECOLOR[i], edgecolor=BOX_EDGECOLOR[i])
-    for whisker in ax['whiskers']:
-        whisker.set(color=BOX_LINE, linestyle=':')
-    for cap in ax['caps']:
-        cap.set_color(BOX_LINE)
-    for median in ax['medians']:
-        median.set(color=BOX_MEDIAN)
-    for flier in ax['fliers']:
-        flier.set(color=BOX_EDGECOLOR[i], marker='o')
 
 
 def generate_box_plot(dataframe, header, crawl_mode, metric):
@@ -355,7 +446,10 @@ def generate_box_plot(dataframe, header, crawl_mode, metric):
     metric: string
         A string with the metric that is plotted
     """
-    bp_dict = dataframe.boxplot(header, grid=False, by=crawl_mode, return_type='both', patch_artist=True)
+    # The whiskers, caps, medians and fliers share one style, so pass it to the boxplot call instead of setting it on every artist
+    bp_dict = dataframe.boxplot(header, grid=False, by=crawl_mode, return_type='both', patch_artist=True,
+                                whiskerprops=dict(color=BOX_LINE, linestyle=':'), capprops=dict(color=BOX_LINE),
+                                medianprops=dict(color=BOX_MEDIAN), flierprops=dict(color=BOX_EDGECOLOR[-1], marker='o'))
     customize_grid(bp_dict[0][0], False, True, False, BOX_BACKGROUND, BOX_GRID, xminor=False)
     customize_box_plot_color(bp_dict[0][1])
     plt.title(f"The distribution of the {metric} per website\nfor both desktop and mobile crawl mode.")
@@ -382,13 +476,13 @@ def generate_box_plots_question_2(dataframe):
     generate_box_plot(dataframe, "nr_tracker_entities", "crawl_mode", "number of disctinct tracker entities")
 
 
-def generate_entry_table_question_3(dataframe, header):
+def generate_entry_table_question_3(stats, header):
     """Generate a header specific entry for the table about the comparison of desktop and mobile crawl data
 
     Parameters
     ----------
-    dataframe: pandas.core.frame.DataFrame
-        A Pandas dataframe with all the data that needs to be analysed
+    stats: pandas.core.frame.DataFrame
+        A Pandas dataframe holding the minimum, maximum and median value of every metric for each crawl mode
     header: tuple
         A tuple holding the header name and belonging text that should appear in the entry
 
@@ -397,16 +491,13 @@ def generate_entry_table_question_3(dataframe, header):
     string
         A string that holds the precise entry text that will be added in the table
     """
-    # Sort the CSV data by crawl_mode and then by the value of the provided header
-    df = dataframe.sort_values(['crawl_mode', header[0]]).groupby('crawl_mode')
-
-    # Get the minimum, maximum and median values for each provided header
-    min_desktop = df[header[0]].min()[0]
-    max_desktop = df[header[0]].max()[0]
-    median_desktop = df[header[0]].median()[0]
-    min_mobile = df[header[0]].min()[1]
-    max_mobile = df[header[0]].max()[1]
-    median_mobile = df[header[0]].median()[1]
+    # Get the minimum, maximum and median values for the provided header
+    min_desktop = stats.loc["Desktop", (header[0], "min")]
+    max_desktop = stats.loc["Desktop", (header[0], "max")]
+    median_desktop = stats.loc["Desktop", (header[0], "median")]
+    min_mobile = stats.loc["Mobile", (header[0], "min")]
+    max_mobile = stats.loc["Mobile", (header[0], "max")]
+    median_mobile = stats.loc["Mobile", (header[0], "median")]
 
     entry = "%s & \multicolumn{1}{r|}{%s} & \multicolumn{1}{r|}{%s} & \multicolumn{1}{r|}{%s} & \multicolumn{1}{r|}{%s} & \multicolumn{1}{r|}{%s} & \multicolumn{1}{r|}{%s} \\\\ \hline \n" % (
         header[1], min_desktop, max_desktop, median_desktop, min_mobile, max_mobile, median_mobile)
@@ -428,60 +519,53 @@ def generate_table_question_3(dataframe):
                ("nr_tracker_domains", "\# distinct tracker domains"),
                ("nr_tracker_entities", "\# distinct tracker entities/companies")]
 
-    # Remove the file if it is already existing
-    if os.path.isfile("data/table_question_3.tex"):
-        os.remove("data/table_question_3.tex")
-
-    # Open the file and write to it
-    file = open("data/table_question_3.tex", "a")
-    file.write("\\begin{table}[ht] \n")
-    file.write("\caption{Comparison of the desktop and mobile crawl data.} \n")
-    file.write("\centering \n")
-    file.write("\\begin{tabular}{|l|rrl|lll|} \n")
-    file.write("\\hline \n")
-    file.write(
+    # Build the table line by line, so it can be written to the file at once
+    lines = []
+    lines.append("\\begin{table}[ht] \n")
+    lines.append("\caption{Comparison of the desktop and mobile crawl data.} \n")
+    lines.append("\centering \n")
+    lines.append("\\begin{tabular}{|l|rrl|lll|} \n")
+    lines.append("\\hline \n")
+    lines.append(
         "\\textbf{} & \multicolumn{3}{c|}{\\textbf{Crawl-desktop}} & \multicolumn{3}{c|}{\\textbf{Crawl-mobile}} \\\\ \hline \n")
-    file.write(
+    lines.append(
         "\\textbf{Metric} & \multicolumn{1}{r|}{\\textbf{Min}} & \multicolumn{1}{r|}{\\textbf{Max}} & \\textbf{Median} & \multicolumn{1}{l|}{\\textbf{Min}} & \multicolumn{1}{l|}{\\textbf{Max}} & \\textbf{Median} \\\\ \hline \n")
 
+    # Compute the minimum, maximum and median of all metrics for both crawl modes in a single groupby
+    stats = dataframe.groupby('crawl_mode')[[header[0] for header in headers]].agg(['min', 'max', 'median'])
+
     for header in headers:
-        entry = generate_entry_table_question_3(dataframe, header)
-        file.write(entry)
+        entry = generate_entry_table_question_3(stats, header)
+        lines.append(entry)
 
-    file.write("\end{tabular} \n")
-    file.write("\label{table:Comparison} \n")
-    file.write("\end{table}")
+    lines.append("\end{tabular} \n")
+    lines.append("\label{table:Comparison} \n")
+    lines.append("\end{table}")
 
-    # Close the file
-    file.close()
+    # Write the whole table to the file in a single call, "w" mode overwrites an existing file
+    with open("data/table_question_3.tex", 'w') as file:
+        file.write("".join(lines))
 
 
-def prevalence(dataframe, mode, target):
-    """Find the prevalence of the targeted group in the crawl
+def prevalence(dataframe, target):
+    """Find the prevalence of the targeted group in both the desktop and the mobile crawl
 
     Parameters
     ----------
     dataframe: pandas.core.frame.DataFrame
         A Pandas dataframe with all the data that needs to be analysed
-    mode: string
-        A string that holds the crawl-mode to use: either desktop or mobile
     target: string
         The group that the prevalence needs to be found for, e.g., third-party domains
 
     Returns
     -------
-    collections.Counter
-        A counter object, holding a dictionary of all items of the targeted group (as keys)
-        and their prevalence (as values) in the crawl
+    dict
+        A dictionary with the crawl-mode as key and a collections.Counter as value, holding all items of the
+        targeted group (as keys) and their prevalence (as values) in the crawl
     """
-    # Collect all items belonging to the target group for the (desktop or mobile) crawl
-    third_parties = dataframe.loc[dataframe["crawl_mode"] == mode, target]
-    # Turn the pandas series into a list and flatten it
-    third_parties_list = list(chain.from_iterable(third_parties))
-    # Use Python Counter to return the count of every element in the list
-    counter_third_parties = Counter(third_parties_list)
-
-    return counter_third_parties
+    # Split the target group per crawl-mode in a single pass over the dataframe, then flatten the pandas series
+    # of each crawl lazily and let Python Counter count every element, without building a list first
+    return {mode: Counter(chain.from_iterable(items)) for mode, items in dataframe.groupby("crawl_mode")[target]}
 
 
 def generate_table_question(questionnr, target, top_ten_desktop, top_ten_mobile, label=""):
@@ -498,38 +582,34 @@ def generate_table_question(questionnr, target, top_ten_desktop, top_ten_mobile,
     top_ten_mobile: list
         The top ten prevalent instances of the target for the mobile crawl mode
     """
-    # Remove the file if it is already existing
-    if os.path.isfile(f"data/table_question_{questionnr}.tex"):
-        os.remove(f"data/table_question_{questionnr}.tex")
-
-    # Open the file and write to it
-    file = open(f"data/table_question_{questionnr}.tex", 'a')
-    file.write("\\begin{table}[ht] \n")
-    file.write("\caption{The ten most prevalent %ss for each crawl.} \n" % (re.sub(r'y$', r'ie', target)))
-    file.write("\centering \n")
-    file.write("\\begin{tabular}{|l|ll|ll|} \n")
-    file.write("\hline")
-    file.write(
+    # Build the table line by line, so it can be written to the file at once
+    lines = []
+    lines.append("\\begin{table}[ht] \n")
+    lines.append("\caption{The ten most prevalent %ss for each crawl.} \n" % (Y_SUFFIX_REGEX.sub(r'ie', target)))
+    lines.append("\centering \n")
+    lines.append("\\begin{tabular}{|l|ll|ll|} \n")
+    lines.append("\hline")
+    lines.append(
         "\\textbf{} & \multicolumn{2}{c|}{\\textbf{Crawl-desktop}} & " +
         "\multicolumn{2}{c|}{\\textbf{Crawl-mobile}} \\\\ \hline \n")
-    file.write(
+    lines.append(
         "& \multicolumn{1}{r|}{\\textbf{%s}} & \\textbf{\# websites} & " % (target.capitalize()) +
         "\multicolumn{1}{l|}{\\textbf{%s}} & \\textbf{\# websites} \\\\ \hline \n" % (target.capitalize()))
 
-    # Write the data of the top ten for both mobile and desktop to the table
-    for i in range(10):
-        entry = ("\\textbf{%d} & \multicolumn{1}{l|}{%s} & " % (i + 1, top_ten_desktop[i][0]) +
-                 "\multicolumn{1}{r|}{%d} & \multicolumn{1}{l|}{%s} & " % (
-                     top_ten_desktop[i][1], top_ten_mobile[i][0]) +
-                 "\multicolumn{1}{r|}{%d} \\\\ \hline \n" % (top_ten_mobile[i][1]))
-        file.write(entry)
+    # Write the data of the top ten for both mobile and desktop to the table. When one crawl has fewer than ten
+    # entries, its missing ranks are shown as "-" so the rows of the other crawl are still all written
+    for rank, (desktop, mobile) in enumerate(zip_longest(top_ten_desktop, top_ten_mobile, fillvalue=("-", "-")), 1):
+        lines.append("\\textbf{%d} & \multicolumn{1}{l|}{%s} & " % (rank, desktop[0]) +
+                     "\multicolumn{1}{r|}{%s} & \multicolumn{1}{l|}{%s} & " % (desktop[1], mobile[0]) +
+                     "\multicolumn{1}{r|}{%s} \\\\ \hline \n" % (mobile[1]))
 
-    file.write("\end{tabular} \n")
-    file.write("\label{tab:%sTop10} \n" % (re.sub(r'(Third-Party|Domain| )', '', target.title())))
-    file.write("\end{table}")
+    lines.append("\end{tabular} \n")
+    lines.append("\label{tab:%sTop10} \n" % (LABEL_WORDS_REGEX.sub('', target.title())))
+    lines.append("\end{table}")
 
-    # Close the file
-    file.close()
+    # Write the whole table to the file in a single call, "w" mode overwrites an existing file
+    with open(f"data/table_question_{questionnr}.tex", 'w') as file:
+        file.write("".join(lines))
 
 
 def generate_table_question_4(dataframe):
@@ -540,8 +620,9 @@ def generate_table_question_4(dataframe):
     dataframe: pandas.core.frame.DataFrame
         A Pandas dataframe with all the data that needs to be analysed
     """
-    top_ten_desktop = prevalence(dataframe, "Desktop", "third_party_domains").most_common(10)
-    top_ten_mobile = prevalence(dataframe, "Mobile", "third_party_domains").most_common(10)
+    prevalence_third_party_domains = prevalence(dataframe, "third_party_domains")
+    top_ten_desktop = prevalence_third_party_domains["Desktop"].most_common(10)
+    top_ten_mobile = prevalence_third_party_domains["Mobile"].most_common(10)
 
     generate_table_question(4, "third-party domain", top_ten_desktop, top_ten_mobile)
 
@@ -554,8 +635,9 @@ def generate_table_question_5(dataframe):
     dataframe: pandas.core.frame.DataFrame
         A Pandas dataframe with all the data that needs to be analysed
     """
-    top_ten_tracker_desktop = prevalence(dataframe, "Desktop", "tracker_domains").most_common(10)
-    top_ten_tracker_mobile = prevalence(dataframe, "Mobile", "tracker_domains").most_common(10)
+    prevalence_tracker_domains = prevalence(dataframe, "tracker_domains")
+    top_ten_tracker_desktop = prevalence_tracker_domains["Desktop"].most_common(10)
+    top_ten_tracker_mobile = prevalence_tracker_domains["Mobile"].most_common(10)
 
     generate_table_question(5, "tracker domain", top_ten_tracker_desktop, top_ten_tracker_mobile)
 
@@ -568,8 +650,9 @@ def generate_table_question_6(dataframe):
     dataframe: pandas.core.frame.DataFrame
         A Pandas dataframe with all the data that needs to be analysed
     """
-    top_ten_entities_desktop = prevalence(dataframe, "Desktop", "tracker_entities").most_common(10)
-    top_ten_entities_mobile = prevalence(dataframe, "Mobile", "tracker_entities").most_common(10)
+    prevalence_tracker_entities = prevalence(dataframe, "tracker_entities")
+    top_ten_entities_desktop = prevalence_tracker_entities["Desktop"].most_common(10)
+    top_ten_entities_mobile = prevalence_tracker_entities["Mobile"].most_common(10)
     generate_table_question(6, "tracker entity", top_ten_entities_desktop, top_ten_entities_mobile)
 
 
@@ -644,24 +727,23 @@ def find_request_with_most_cookies(dataframe, mode):
     most_number_of_cookies: int
         An integer holding the number of cookies set by the request
     """
-    # reset_index(drop=True) resets the indices from 0 to the length of the number of entries in the
-    # dataframe that correspond to the right crawl mode
-    requests = dataframe.loc[dataframe["crawl_mode"] == mode, "requests"].reset_index(drop=True)
-    website_domain = dataframe.loc[dataframe["crawl_mode"] == mode, "website_domain"].reset_index(drop=True)
+    # Select both columns with one mask and walk them side by side, so no index has to be reset
+    mode_data = dataframe.loc[dataframe["crawl_mode"] == mode, ["website_domain", "requests"]]
     most_number_of_cookies = 0
-    request_hostname = ""
+    request_url = ""
     website = ""
 
     # Search through all requests in the requests_list for the most cookies
-    for i, requests_domain in enumerate(requests):
+    for website_domain, requests_domain in zip(mode_data["website_domain"].to_numpy(), mode_data["requests"].to_numpy()):
         for request in requests_domain:
-            request_url = request.get("request_url")
             nr_cookies = request.get("nr_cookies")
             if most_number_of_cookies < nr_cookies:
                 most_number_of_cookies = nr_cookies
-                request_hostname = urlparse(request_url).hostname
-                website = website_domain[i]
+                request_url = request.get("request_url")
+                website = website_domain
 
+    # Only the hostname of the request with the most cookies is needed, so parse that url once
+    request_hostname = urlparse(request_url).hostname if request_url else ""
     return request_hostname, website, most_number_of_cookies
 
 
@@ -701,95 +783,83 @@ def generate_table_question_9(dataframe):
     dataframe: pandas.core.frame.DataFrame
         A Pandas dataframe with all the data that needs to be analysed
     """
-    # Remove the file if it is already existing
-    if os.path.isfile(f"data/table_question_9.tex"):
-        os.remove(f"data/table_question_9.tex")
-
-    # Open the file and write to it
-    file = open(f"data/table_question_9.tex", 'a')
-    file.write("\\begin{table}[ht] \n")
-    file.write("\caption{Request with the most cookies for the desktop and mobile crawl.} \n")
-    file.write("\centering \n")
-    file.write("\\begin{tabular}{|l|l|l|r|c|} \n")
-    file.write("\hline")
-    file.write(
+    # Build the table line by line, so it can be written to the file at once
+    lines = []
+    lines.append("\\begin{table}[ht] \n")
+    lines.append("\caption{Request with the most cookies for the desktop and mobile crawl.} \n")
+    lines.append("\centering \n")
+    lines.append("\\begin{tabular}{|l|l|l|r|c|} \n")
+    lines.append("\hline")
+    lines.append(
         "\\textbf{Crawl} & \\textbf{Request hostname} & \\textbf{Website} & " +
         "\multicolumn{1}{l|}{\\textbf{\# cookies}} & \multicolumn{1}{l|}{\\textbf{First-party request}} \\\\ \hline \n")
 
     # Write the data for the request with the most cookies to the file
     entry_desktop = generate_entry_table_question_9(dataframe, "Desktop")
-    file.write(entry_desktop)
+    lines.append(entry_desktop)
     entry_mobile = generate_entry_table_question_9(dataframe, "Mobile")
-    file.write(entry_mobile)
+    lines.append(entry_mobile)
 
-    file.write("\end{tabular} \n")
-    file.write("\label{tab:mostcookies} \n")
-    file.write("\end{table}")
+    lines.append("\end{tabular} \n")
+    lines.append("\label{tab:mostcookies} \n")
+    lines.append("\end{table}")
 
-    # Close the file
-    file.close()
+    # Write the whole table to the file in a single call, "w" mode overwrites an existing file
+    with open(f"data/table_question_9.tex", 'w') as file:
+        file.write("".join(lines))
 
 
-def find_cookies_longest_lifespans(dataframe, mode, number):
+def find_cookies_longest_lifespans(cookies_list):
     """Find the three cookies with the longest lifespans
 
     Parameters
     ----------
-    dataframe: pandas.core.frame.DataFrame
-        A Pandas dataframe with all the data that needs to be analysed
-    mode: string
-        A string that holds the crawl-mode to use: either desktop or mobile
-    number: int
-        An integer holding the value of whether we want the first, second or third cookie regarding the lifespans
+    cookies_list: pandas.core.series.Series
+        A Pandas series holding the list of cookies of every website in one crawl mode
 
     Returns
     -------
-    longest_lifespans_cookies: dict
-        A dictionary holding the three cookies with the longest lifespans
-    longest_lifespans[number][1]: string
-        A string holding the information whether the maximal life span was in the Max-Age or Expires column
+    longest_lifespans_cookies: list
+        A list holding a (cookie dictionary, column) tuple for each of the three cookies with the longest lifespans,
+        where column tells whether the maximal life span was in the Max-Age or Expires column
     """
-    # reset_index(drop=True) resets the indices from 0 to the length of the number of entries in the
-    # dataframe that correspond to the right crawl mode
-    cookies_list = dataframe.loc[dataframe["crawl_mode"] == mode, "cookies"].reset_index(drop=True)
-    lifespans = []
-
-    for i, entry_with_cookie_dicts in enumerate(cookies_list):
-        if entry_with_cookie_dicts:
-            for j, cookie_dict in enumerate(entry_with_cookie_dicts):
-                max_age = cookie_dict.get("Max-Age")
-                expiry = cookie_dict.get("Expires")
-                # max_age overrides the expires field: https://www.rfc-editor.org/rfc/rfc7234#section-5.3
-                if max_age:
-                    lifespans.append([float(max_age), "max-age", i, j])
-                elif expiry and expiry != "Session":
-                    # Change the dates to in how many seconds they will expire
-                    expiry = expiry.replace("-", "").replace(" ", "")
-                    # In case the day name is written in full, then only take the first 3 letters
-                    if len(expiry) >= 24:
-                        day, rest = expiry.split(",")
-                        expiry = day[:3] + "," + rest
-                    # Remove if there is a timezone or trailing zeros
-                    if (len(expiry) == 21 or len(expiry) == 22 or len(expiry) == 23 or len(expiry) == 24) and \
-                            ":" not in expiry[-4:]:
-                        expiry = expiry[:-4]
-                    # Exception for when the year is only 2 digits
-                    try:
-                        expiry = datetime.strptime(expiry, '%a,%d%b%Y%H:%M:%S')
-                        current_time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        current_time = datetime.strptime(current_time_str, '%Y-%m-%d %H:%M:%S')
-                    except ValueError:
-                        expiry = datetime.strptime(expiry, '%a,%d%b%y%H:%M:%S')
-                        current_time_str = datetime.now().strftime("%y-%m-%d %H:%M:%S")
-                        current_time = datetime.strptime(current_time_str, '%y-%m-%d %H:%M:%S')
-                    expiry_age = (expiry - current_time).total_seconds()
-                    lifespans.append([expiry_age, "expires", i, j])
-
-    # Sort the list of lists on the first argument of the inner list
-    longest_lifespans = sorted(lifespans, key=itemgetter(0), reverse=True)[:3]
-    longest_lifespans_cookies = cookies_list[longest_lifespans[number][2]][longest_lifespans[number][3]]
-
-    return longest_lifespans_cookies, longest_lifespans[number][1]
+    # Flatten all cookies into one row per cookie, so the expiry dates can be parsed in a single call. The row keeps
+    # a reference to the cookie dictionary itself, so the longest living cookies do not have to be looked up again
+    cookies = pd.DataFrame([(cookie_dict, cookie_dict.get("Max-Age"), cookie_dict.get("Expires"))
+                            for entry_with_cookie_dicts in cookies_list if entry_with_cookie_dicts
+                            for cookie_dict in entry_with_cookie_dicts],
+                           columns=["cookie", "max_age", "expiry"])
+
+    # max_age overrides the expires field: https://www.rfc-editor.org/rfc/rfc7234#section-5.3
+    has_max_age = cookies["max_age"].astype(bool)
+    expiries = cookies.loc[~has_max_age & cookies["expiry"].astype(bool) & (cookies["expiry"] != "Session"), "expiry"]
+
+    # Remove the dashes and spaces, dates are written both as "Wed, 21 Oct 2015" and as "Wed, 21-Oct-15"
+    expiries = expiries.str.replace("-", "", regex=False).str.replace(" ", "", regex=False)
+    # Take the date and time out of the expiry date, the (short or full) day name and timezone are not needed
+    parts = expiries.str.extract(EXPIRY_DATE_REGEX).dropna()
+    # Exception for when the year is only 2 digits, which is read the same way strptime reads %y (69-99 is 19xx)
+    centuries = parts["year"].astype(int).ge(69).map({True: "19", False: "20"})
+    years = parts["year"].mask(parts["year"].str.len() == 2, centuries + parts["year"])
+    # Write the dates in ISO 8601, which numpy parses for all dates at once. Unlike a pandas timestamp, a datetime64
+    # in seconds also fits dates far in the future, like the commonly used 31 Dec 9999
+    iso_dates = (years + "-" + parts["month"].str.lower().map(MONTH_NUMBERS) + "-" + parts["day"].str.zfill(2) + "T" +
+                 parts["hour"].str.zfill(2) + ":" + parts["minute"] + ":" + parts["second"]).dropna()
+    expiry_dates = iso_dates.to_numpy(dtype="datetime64[s]")
+    current_time = np.datetime64(datetime.now(), "s")
+    # Change the dates to in how many seconds they will expire
+    expiry_ages = pd.Series((expiry_dates - current_time).astype(float), index=iso_dates.index)
+
+    cookies["lifespan"] = cookies["max_age"].where(has_max_age).astype(float)
+    cookies.loc[expiry_ages.index, "lifespan"] = expiry_ages
+    cookies["column"] = has_max_age.map({True: "max-age", False: "expires"})
+
+    # Session cookies and unreadable dates have no lifespan. nlargest keeps the first cookie on ties, just like a
+    # stable sort on the lifespans would
+    longest_lifespans = cookies.dropna(subset=["lifespan"]).nlargest(3, "lifespan")
+    longest_lifespans_cookies = list(zip(longest_lifespans["cookie"], longest_lifespans["column"]))
+
+    return longest_lifespans_cookies
 
 
 def replace_dict_value(dictionary, key, value):
@@ -825,7 +895,7 @@ def generate_entry_table_question_10(longest_lifespans_cookies, column):
     Parameters
     ----------
     longest_lifespans_cookies: dict
-        A dictionary holding the three cookies with the longest lifespans
+        A dictionary holding one of the three cookies with the longest lifespans
     column: string
         A string holding the information whether the maximal life span was in the Max-Age or Expires column
 
@@ -834,10 +904,11 @@ def generate_entry_table_question_10(longest_lifespans_cookies, column):
     string
         A string that holds the precise entry text that will be added in the table
     """
-    # First cast the dictionary keys to lowercase and then build up the table entry
+    # The name and value of the cookie are its first item, so take those without building the list of all keys
+    name = next(iter(longest_lifespans_cookies))
+    value = longest_lifespans_cookies[name]
+    # Websites write the attribute names in different cases, so cast the dictionary keys to lowercase to look them up
     cookie_dict = {k.lower(): v for k, v in longest_lifespans_cookies.items()}
-    name = list(longest_lifespans_cookies.keys())[0]
-    value = cookie_dict.get(name.lower())
     domain = replace_dict_value(cookie_dict, "domain", "-")
     path = replace_dict_value(cookie_dict, "path", "-")
     expiry = cookie_dict.get(column)
@@ -852,43 +923,39 @@ def generate_entry_table_question_10(longest_lifespans_cookies, column):
     return entry
 
 
-def generate_table_question_10(dataframe, mode):
+def generate_table_question_10(cookies_list, mode):
     """Generate a LaTeX table holding the three cookies with the longest lifespan in the `crawl_mode` crawl
 
     Parameters
     ----------
-    dataframe: pandas.core.frame.DataFrame
-        A Pandas dataframe with all the data that needs to be analysed
+    cookies_list: pandas.core.series.Series
+        A Pandas series holding the list of cookies of every website in the `mode` crawl
     mode: str
         The crawl mode for which the table needs to be generated
     """
-    # Remove the file if it is already existing
-    if os.path.isfile(f"data/table_question_10_{mode.lower()}.tex"):
-        os.remove(f"data/table_question_10_{mode.lower()}.tex")
-
-    # Open the file and write to it
-    file = open(f"data/table_question_10_{mode.lower()}.tex", 'a')
-    file.write("\\begin{table}[!htbp] \n")
-    file.write("\caption{Three cookies with the longest lifespan in the %s crawl.} \n" % mode)
-    file.write("\centering \n")
-    file.write("\\resizebox{\\textwidth}{!}{\\begin{tabular}{|l|l|l|l|l|l|l|l|l|} \n")
-    file.write("\hline\\rowcolor{lightgray} \n")
-    file.write(
+    # Build the table line by line, so it can be written to the file at once
+    lines = []
+    lines.append("\\begin{table}[!htbp] \n")
+    lines.append("\caption{Three cookies with the longest lifespan in the %s crawl.} \n" % mode)
+    lines.append("\centering \n")
+    lines.append("\\resizebox{\\textwidth}{!}{\\begin{tabular}{|l|l|l|l|l|l|l|l|l|} \n")
+    lines.append("\hline\\rowcolor{lightgray} \n")
+    lines.append(
         "\\textbf{Name} & \\textbf{Value} & \\textbf{Domain} & \\textbf{Path} & \\textbf{Expires / Max-Age} & " +
         "\\textbf{Size} & \\textbf{HttpOnly} & \\textbf{Secure} & \\textbf{SameSite} \\\\ \hline \n")
 
-    # Write the data for the three cookies with the longest expiry
-    for i in range(3):
-        longest_lifespans_cookies, column = find_cookies_longest_lifespans(dataframe, mode, i)
+    # Write the data for the three cookies with the longest expiry, which are all found in one pass over the cookies
+    for longest_lifespans_cookies, column in find_cookies_longest_lifespans(cookies_list):
         entry = generate_entry_table_question_10(longest_lifespans_cookies, column)
-        file.write(entry)
+        lines.append(entry)
 
-    file.write("\end{tabular}} \n")
-    file.write("\label{tab:lifespan_%s} \n" % mode)
-    file.write("\end{table}")
+    lines.append("\end{tabular}} \n")
+    lines.append("\label{tab:lifespan_%s} \n" % mode)
+    lines.append("\end{table}")
 
-    # Close the file
-    file.close()
+    # Write the whole table to the file in a single call, "w" mode overwrites an existing file
+    with open(f"data/table_question_10_{mode.lower()}.tex", 'w') as file:
+        file.write("".join(lines))
 
 
 def top_ten_tracker_redirection_pairs(dataframe, mode, tracker_domains):
@@ -911,9 +978,12 @@ def top_ten_tracker_redirection_pairs(dataframe, mode, tracker_domains):
     # Filter the redirection pairs for the crawl mode
     pairs = dataframe.loc[dataframe["crawl_mode"] == mode, "redirection_pairs"]
     # Get all tuples of redirection pairs into a list of tuples
-    pairs_tuples = [tuple(i) for i in list(chain.from_iterable(pairs))]
+    pairs_tuples = [tuple(i) for i in chain.from_iterable(pairs)]
+    # The same hostnames occur in many pairs, so match every distinct hostname against the blocklist only once
+    tracker_hostnames = {hostname for hostname in set(chain.from_iterable(pairs_tuples))
+                         if domain_in_blocklist(tracker_domains, hostname)[1]}
     # Filter the redirection pairs that involve a tracker domain and get the top ten most prevalent pairs
-    tracker_pairs = [p for p in pairs_tuples if domain_in_blocklist(tracker_domains, p[0])[1] or domain_in_blocklist(tracker_domains, p[1])[1]]
+    tracker_pairs = [p for p in pairs_tuples if p[0] in tracker_hostnames or p[1] in tracker_hostnames]
     top_ten_pairs = Counter(tracker_pairs).most_common(10)
 
     return top_ten_pairs
@@ -929,32 +999,29 @@ def generate_table_question_11(crawl_mode, top_ten_redirection_pairs):
     top_ten_redirection_pairs: list
         A list with the top ten prevalent cross-domain HTTP redirection pairs
     """
-    # Remove the file if it is already existing
-    if os.path.isfile(f"data/table_question_11_{crawl_mode.lower()}.tex"):
-        os.remove(f"data/table_question_11_{crawl_mode.lower()}.tex")
-
-    # Open the file and write to it
-    file = open(f"data/table_question_11_{crawl_mode.lower()}.tex", 'a')
-    file.write("\\begin{table}[ht] \n")
-    file.write("\caption{The ten most prevalent cross-domain HTTP redirection pairs (%s crawl).} \n" % (crawl_mode))
-    file.write("\centering \n")
-    file.write("\\begin{tabular}{|l|l|l|l|} \n")
-    file.write("\hline \n")
-    file.write(
+    # Build the table line by line, so it can be written to the file at once
+    lines = []
+    lines.append("\\begin{table}[ht] \n")
+    lines.append("\caption{The ten most prevalent cross-domain HTTP redirection pairs (%s crawl).} \n" % (crawl_mode))
+    lines.append("\centering \n")
+    lines.append("\\begin{tabular}{|l|l|l|l|} \n")
+    lines.append("\hline \n")
+    lines.append(
         "& \\textbf{Source hostname} & \\textbf{Target hostname} & \\textbf{Number of distinct websites} \\\\ \hline \n")
 
     # Write the data of the top ten redirection pairs for both mobile and desktop to the table
     for i in range(10):
         entry = ("\\textbf{%d} & %s & %s & " % (i + 1, top_ten_redirection_pairs[i][0][0], top_ten_redirection_pairs[i][0][1]) +
                  "\multicolumn{1}{r|}{%d} \\\\ \hline \n" % (top_ten_redirection_pairs[i][1]))
-        file.write(entry)
+        lines.append(entry)
 
-    file.write("\end{tabular} \n")
-    file.write("\label{tab:redirections%s} \n" % (crawl_mode))
-    file.write("\end{table}")
+    lines.append("\end{tabular} \n")
+    lines.append("\label{tab:redirections%s} \n" % (crawl_mode))
+    lines.append("\end{table}")
 
-    # Close the file
-    file.close()
+    # Write the whole table to the file in a single call, "w" mode overwrites an existing file
+    with open(f"data/table_question_11_{crawl_mode.lower()}.tex", 'w') as file:
+        file.write("".join(lines))
 
 
 def generate_tables_question_11(dataframe, tracker_domains):
@@ -988,8 +1055,10 @@ def main():
     generate_scatter_plots_question_7(dataframe)
     generate_scatter_plots_question_8(dataframe)
     generate_table_question_9(dataframe)
-    generate_table_question_10(dataframe, "Desktop")
-    generate_table_question_10(dataframe, "Mobile")
+    # Split the cookies per crawl mode once, instead of filtering the whole dataframe for each table
+    cookies_per_mode = dict(tuple(dataframe.groupby("crawl_mode")["cookies"]))
+    generate_table_question_10(cookies_per_mode["Desktop"], "Desktop")
+    generate_table_question_10(cookies_per_mode["Mobile"], "Mobile")
     generate_tables_question_11(dataframe, tracker_domains)
 
 
@@ -24,7 +24,10 @@ import json
 import requests as python_requests
 import pandas as pd
 from tld import get_fld
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import lru_cache
+from urllib.parse import SplitResult, urlsplit
 
 from seleniumwire import webdriver
 from selenium.webdriver.common.by import By
@@ -57,11 +60,17 @@ def parse_arguments():
     parser.add_argument("-v", "--view", action="store", type=str, required=True,
                         choices=["headless", "headful"],
                         help="Choose between headless and headful modes of the crawler.")
+    parser.add_argument("-w", "--workers", action="store", type=int, required=False, default=1,
+                        help="The number of domains of the input list that are crawled at the same time. Note that "
+                             "parallel crawls share the CPU and network, which affects the measured page load times.")
     arguments = parser.parse_args()
 
     if (not arguments.url and not arguments.input) or (arguments.url and arguments.input):
         parser.error("Invalid input: please provide either the -u or -i argument!")
 
+    if arguments.workers < 1:
+        parser.error("Invalid input: the number of workers should be at least 1!")
+
     print("Arguments have been parsed successfully!")
     return vars(arguments)
 
@@ -226,6 +235,29 @@ def get_url_requests_times(driver, url):
     return post_pageload_url, requests_url, pageload_start_ts, pageload_end_ts
 
 
+def truncate_headers(headers):
+    """Copy the headers into a dictionary with their values cut off at 512 characters
+
+    Parameters
+    ----------
+    headers: seleniumwire.webdriver.request.HTTPHeaders
+        The headers of a HTTP request or response
+
+    Returns
+    -------
+    dict
+        A dictionary containing the (truncated) headers
+    """
+    truncated_headers = {}
+
+    # Assigning to the seleniumwire headers adds a header instead of replacing it, so build a new dictionary.
+    # Just like dict(headers), only the first value of a header that occurs multiple times is kept.
+    for key, value in headers.items():
+        truncated_headers.setdefault(key, value[:512])
+
+    return truncated_headers
+
+
 def get_headers(request):
     """Retrieve the headers of a HTTP request and its response
 
@@ -241,23 +273,57 @@ def get_headers(request):
     response_headers: dict
         A dictionary containing all the headers of the response for the HTTP request
     """
-    request_headers = request.headers
+    request_headers = truncate_headers(request.headers)
     response_headers = None
 
-    for key in request_headers.keys():
-        if len(request_headers[key]) > 512:
-            request_headers[key] = request_headers[key][:512]
-
     # Check whether the request had any response
     if request.response:
-        response_headers = request.response.headers
-        for key in response_headers.keys():
-            if len(response_headers[key]) > 512:
-                response_headers[key] = response_headers[key][:512]
+        response_headers = truncate_headers(request.response.headers)
 
     return request_headers, response_headers
 
 
+@lru_cache(maxsize=4096)
+def get_hostname_fld(hostname):
+    """Retrieve the first level domain of a hostname, remembering the result for hostnames that were seen before
+
+    Parameters
+    ----------
+    hostname: str
+        The hostname of a URL
+
+    Returns
+    ----------
+    str
+        The first level domain of the hostname
+    """
+    # Rebuild the URL parts that get_fld looks at, IPv6 addresses need their brackets back to be read as a hostname
+    netloc = f"[{hostname}]" if ":" in hostname else hostname
+    return get_fld(SplitResult("https", netloc, "", "", ""))
+
+
+def get_url_fld(url):
+    """Retrieve the first level domain of a URL, like get_fld does, but parse the public suffix list only once per
+    hostname, since a webpage sends many requests to the same hosts
+
+    Parameters
+    ----------
+    url: str
+        The URL for which the first level domain is retrieved
+
+    Returns
+    ----------
+    str
+        The first level domain of the URL
+    """
+    # The first level domain only depends on the hostname, the path and query of the URL do not matter
+    hostname = urlsplit(url).hostname
+    if not hostname:
+        raise TldBadUrl(url=url)
+
+    return get_hostname_fld(hostname)
+
+
 def get_third_party_domains(domain, requests):
     """Retrieve a list of all third party domains used by the requests for the given domain
 
@@ -278,7 +344,7 @@ def get_third_party_domains(domain, requests):
 
     for request in requests:
         try:
-            request_domain = get_fld(request.url)
+            request_domain = get_url_fld(request.url)
             if request_domain not in first_party_domains:
                 third_party_domains.add(request_domain)
         except TldDomainNotFound:
@@ -307,8 +373,8 @@ def detect_redirections(domain, requests, post_pageload_url):
     redirections = []
 
     # Detect address bar redirections
-    if domain != get_fld(post_pageload_url):
-        redirections.append((domain, get_fld(post_pageload_url)))
+    if domain != get_url_fld(post_pageload_url):
+        redirections.append((domain, get_url_fld(post_pageload_url)))
 
     # Detect redirections in the requests
     for request in requests:
@@ -320,8 +386,8 @@ def detect_redirections(domain, requests, post_pageload_url):
             if "location" in response_headers:
                 try:
                     location = response_headers['location']
-                    if get_fld(location) != get_fld(request_url):
-                        redirections.append((get_fld(request_url), get_fld(location)))
+                    if get_url_fld(location) != get_url_fld(request_url):
+                        redirections.append((get_url_fld(request_url), get_url_fld(location)))
                 except TldBadUrl:
                     print("An invalid URL format was found!")
                     pass
@@ -329,15 +395,36 @@ def detect_redirections(domain, requests, post_pageload_url):
     return redirections
 
 
-def search_element_using_xpath(driver, accept_word):
+@lru_cache(maxsize=1)
+def read_accept_word_xpaths():
+    """Read the accept words and build the XPATH for every word, this is only done once for the whole crawl
+
+    Returns
+    ----------
+    list
+        A list with for every accept word the XPATH that searches for it
+    """
+    # We open and read the full datalist of the priv-accept project.
+    with open("accept_words.txt", encoding="utf8") as acceptwords_file:
+        accept_words = acceptwords_file.read().splitlines()
+
+    # Long and complicated XPATH. Searches case-insensitive for a certain accept word in WebElements
+    # and Text present on the webpage, but not in span elements.
+    return ["//*[(normalize-space(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', "
+            "'abcdefghijklmnopqrstuvwxyz')) = \"" + accept_word + "\" or translate(@value, "
+            "'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz') = \"" + accept_word + "\")"
+            "and not(self::span)]" for accept_word in accept_words]
+
+
+def search_element_using_xpath(driver, accept_xpath):
     """Search for the accept word using the XPATH
 
     Parameters
     ----------
     driver: seleniumwire.webdriver
         The webdriver that is used to visit the domain
-    accept_word: str
-        The accept cookies word to be searched
+    accept_xpath: str
+        The XPATH searching for the accept cookies word
 
     Returns
     ----------
@@ -346,14 +433,7 @@ def search_element_using_xpath(driver, accept_word):
     """
     # noinspection PyBroadException
     try:
-        allow_all_cookies = driver.find_elements(
-            # Long and complicated XPATH. Searches case-insensitive for a certain accept word in WebElements
-            # and Text present on the webpage, but not in span elements.
-            By.XPATH, "//*[(normalize-space(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', "
-                      "'abcdefghijklmnopqrstuvwxyz')) = \"" + accept_word + "\" or translate(@value, "
-                      "'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz') = \"" + accept_word + "\")"
-                      "and not(self::span)]"
-        )
+        allow_all_cookies = driver.find_elements(By.XPATH, accept_xpath)
         return allow_all_cookies
     except Exception:
         return None
@@ -387,7 +467,7 @@ def try_clicking_element(element):
         return False, status
 
 
-def search_and_click_iframes(driver, status, accept_word):
+def search_and_click_iframes(driver, status, accept_xpath):
     """Look for a WebElement containing the accept word in different iframes
 
     Parameters
@@ -396,8 +476,8 @@ def search_and_click_iframes(driver, status, accept_word):
         The webdriver that is used to visit the domain
     status: str
         Specifying the status of clicking the element
-    accept_word: str
-        The accept cookies word to be searched
+    accept_xpath: str
+        The XPATH searching for the accept cookies word
 
     Returns
     ----------
@@ -414,7 +494,7 @@ def search_and_click_iframes(driver, status, accept_word):
             except (NoSuchFrameException, StaleElementReferenceException, WebDriverException):
                 pass
 
-            allow_all_cookies = search_element_using_xpath(driver, accept_word)
+            allow_all_cookies = search_element_using_xpath(driver, accept_xpath)
 
             if allow_all_cookies:
                 for element in allow_all_cookies:
@@ -438,6 +518,44 @@ def search_and_click_iframes(driver, status, accept_word):
         return False, "errored"
 
 
+def accept_words_present(driver):
+    """Check with a single search per document whether any of the accept words is on the webpage or in its iframes
+
+    Parameters
+    ----------
+    driver: seleniumwire.webdriver
+        The webdriver that is used to visit the domain
+
+    Returns
+    ----------
+    bool
+        A boolean value that is only False when every search succeeded and none of the accept words was found
+    """
+    # All XPATHs joined into one union, so the browser searches for every accept word in one go
+    accept_words_xpath = " | ".join(read_accept_word_xpaths())
+
+    if search_element_using_xpath(driver, accept_words_xpath) != []:
+        return True
+
+    try:
+        list_of_iframes = driver.find_elements(By.TAG_NAME, "iframe")
+    except TimeoutException:
+        return True
+
+    for frame in list_of_iframes:
+        try:
+            driver.switch_to.frame(frame)
+            found_in_iframe = search_element_using_xpath(driver, accept_words_xpath) != []
+            driver.switch_to.default_content()
+        except (NoSuchFrameException, StaleElementReferenceException, WebDriverException):
+            # Let the search for every accept word deal with iframes that cannot be searched
+            return True
+        if found_in_iframe:
+            return True
+
+    return False
+
+
 def allow_cookies(driver):
     """Look for the button for accepting cookies and accepts the cookies, if possible, otherwise logs the error given
 
@@ -455,17 +573,18 @@ def allow_cookies(driver):
     """
     status = ""
 
-    # We open and read the full datalist of the priv-accept project.
-    with open("accept_words.txt", encoding="utf8") as acceptwords_file:
-        accept_words = acceptwords_file.read().splitlines()
+    # Searching word by word costs a few browser round trips for every accept word, so first check whether there is
+    # anything to find at all. The words are still searched one at a time when found, as their order sets the priority
+    if not accept_words_present(driver):
+        return False, "not_found"
 
-    for accept_word in accept_words:
+    for accept_xpath in read_accept_word_xpaths():
 
-        accepted_via_iframe, status = search_and_click_iframes(driver, status, accept_word)
+        accepted_via_iframe, status = search_and_click_iframes(driver, status, accept_xpath)
         if accepted_via_iframe:
             return accepted_via_iframe, status
         else:
-            allow_all_cookies = search_element_using_xpath(driver, accept_word)
+            allow_all_cookies = search_element_using_xpath(driver, accept_xpath)
 
             if allow_all_cookies:
                 for element in allow_all_cookies:
@@ -519,11 +638,12 @@ def get_nr_cookies(request):
         The number of cookies sent by the request
     """
     nr_cookies = 0
-    request_headers = request.headers
+    # Look the header up only once, the headers object searches all headers on every access
+    cookie_header = request.headers.get("cookie")
 
-    if "cookie" in request_headers:
-        cookies = request_headers['cookie'].split("; ")
-        nr_cookies = len(cookies)
+    if cookie_header is not None:
+        # Counting the separators gives the number of cookies without building the list of cookies
+        nr_cookies = cookie_header.count("; ") + 1
 
     return nr_cookies
 
@@ -621,13 +741,13 @@ def build_requests_list(requests_url):
         nr_cookies = get_nr_cookies(request)
         requests.append({"request_url": url,
                               "timestamp": timestamp.strftime("%d/%m/%Y %H:%M:%S.%f"),
-                              "request_headers": dict(request_headers),
-                              "response_headers": dict(response_headers) if response_headers else response_headers,
+                              "request_headers": request_headers,
+                              "response_headers": response_headers,
                               "nr_cookies": nr_cookies})
     return requests
 
 
-def crawl_url(params, domain, rank):
+def crawl_url(params, domain, rank, driver_path):
     """Access a webpage, take screenshots, accept cookies and create a dictionary
     containing various information about the webpage visit
 
@@ -639,15 +759,14 @@ def crawl_url(params, domain, rank):
         The domain that is visited
     rank: int
         The tranco rank of the domain that is being visited
+    driver_path: str
+        The path to the ChromeDriver executable
 
     Returns
     ----------
     dict
         A dictionary containing various information retrieved from the URL being accessed by the webdriver
     """
-    chrome_options = set_webdriver_options(params)
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), chrome_options=chrome_options)
-
     error = check_errors(domain)
 
     url_dict = {"website_domain": domain,
@@ -655,6 +774,11 @@ def crawl_url(params, domain, rank):
                 "crawl_mode": "Mobile" if params["mobile"] else "Desktop"}
 
     if error is None:
+        # Every domain gets a fresh browser, so no cache or cookies of a previous domain influence the measurements.
+        # The browser is only started for domains that passed the error check.
+        chrome_options = set_webdriver_options(params)
+        driver = webdriver.Chrome(service=Service(driver_path), chrome_options=chrome_options)
+
         post_pageload_url, requests_url, pageload_start_ts, pageload_end_ts = get_url_requests_times(driver, domain)
         if post_pageload_url:
             time.sleep(10)
@@ -685,6 +809,7 @@ def crawl_url(params, domain, rank):
                              "redirect_pairs": detect_redirections(domain, requests_url, post_pageload_url),
                              "requests": requests})
         else:
+            driver.quit()
             url_dict.update({"error": "Timeout"})
     else:
         url_dict.update({"error": error})
@@ -692,7 +817,7 @@ def crawl_url(params, domain, rank):
     return url_dict
 
 
-def crawl_list(params, domain_list):
+def crawl_list(params, domain_list, driver_path):
     """Crawl all the domains in the list and create a JSON file per domain
 
     Parameters
@@ -701,11 +826,23 @@ def crawl_list(params, domain_list):
         A dictionary with the values for all command line arguments
     domain_list: dict
         A dictionary of domains to be crawled
+    driver_path: str
+        The path to the ChromeDriver executable
     """
     print("Please wait, we are trying to crawl your entire input list!")
-    for tranco_rank in domain_list:
-        url_dict = crawl_url(params, domain_list[tranco_rank], tranco_rank)
-        convert_to_json(params, domain_list[tranco_rank], url_dict)
+    # Every crawl_url call starts its own browser, so the domains can be crawled independently of each other.
+    # The crawls mostly wait on the network and the browser, so threads are enough to run them in parallel.
+    with ThreadPoolExecutor(max_workers=params["workers"]) as executor:
+        futures = {executor.submit(crawl_url, params, domain_list[tranco_rank], tranco_rank, driver_path):
+                   domain_list[tranco_rank] for tranco_rank in domain_list}
+        try:
+            # Save every domain as soon as its crawl is done
+            for future in as_completed(futures):
+                convert_to_json(params, futures[future], future.result())
+        finally:
+            # When a domain fails or the crawl is interrupted (Ctrl+C), stop like the serial crawl did instead of
+            # crawling the rest of the queue first. After a complete crawl there is nothing left to cancel.
+            executor.shutdown(wait=False, cancel_futures=True)
 
 
 def convert_to_json(params, domain, url_dict):
@@ -732,9 +869,12 @@ def main():
     """ Parse arguments and decide whether we crawl a list of domains or a single domain
     """
     args = parse_arguments()
+    # Look up (and if needed download) the ChromeDriver only once, instead of once for every domain
+    driver_path = ChromeDriverManager().install()
+
     if args["input"]:
         tranco_domains = read_tranco_top_500(args["input"])
-        crawl_list(args, tranco_domains)
+        crawl_list(args, tranco_domains, driver_path)
 
     if args["url"]:
         tranco_rank = None
@@ -744,7 +884,7 @@ def main():
                 tranco_rank = rank
                 break
 
-        url_dict = crawl_url(args, args["url"], tranco_rank)
+        url_dict = crawl_url(args, args["url"], tranco_rank, driver_path)
         convert_to_json(args, args["url"], url_dict)
 
     print("The crawl has completed successfully and your data was saved locally!")